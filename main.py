@@ -1,14 +1,39 @@
 import os
 import time
-import requests
+import random
+import queue
+import atexit
+import signal
+import logging
+import logging.handlers
+import httpx
 import asyncio
-from datetime import datetime, timedelta
-from telegram import Bot
+import numpy as np
+import orjson
+from bisect import bisect_right
+from dataclasses import dataclass
+from datetime import datetime
+from telegram.ext import AIORateLimiter, ExtBot
+from telegram.request import HTTPXRequest
 from dotenv import load_dotenv
 from tokens import TOKENS
 
 load_dotenv()
 
+# Logging: records go through a queue to a background thread, so console writes never block the event loop.
+# LOG_LEVEL=DEBUG also shows the per-token change lines of every timeframe check.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+log = logging.getLogger("coin_alert_bot")
+log.setLevel(LOG_LEVEL)
+log.propagate = False
+log_queue = queue.SimpleQueue()
+log.addHandler(logging.handlers.QueueHandler(log_queue))
+log_stream_handler = logging.StreamHandler()
+log_stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+log_listener = logging.handlers.QueueListener(log_queue, log_stream_handler)
+log_listener.start()
+atexit.register(log_listener.stop)
+
 TOKEN = os.getenv("BOT_TOKEN")
 CHAT_ID = os.getenv("CHAT_ID")
 
@@ -22,23 +47,92 @@ if ',' in CHAT_ID:
 else:
     CHAT_IDS = [CHAT_ID.strip()]
 
-print(f"📋 Bot will send messages to {len(CHAT_IDS)} chat(s)")
+log.info(f"📋 Bot will send messages to {len(CHAT_IDS)} chat(s)")
+
+# Chats are sent to concurrently; this caps how many sends are in flight at once
+TELEGRAM_MAX_CONCURRENT_SENDS = 10
+telegram_semaphore = asyncio.Semaphore(TELEGRAM_MAX_CONCURRENT_SENDS)
 
-bot = Bot(token=TOKEN)
+# Telegram rate limits (kept just under the documented 30 msg/s per bot and 20 msg/min per group).
+# A RetryAfter from Telegram pauses all sends for the requested time and is retried up to TELEGRAM_MAX_RETRIES times.
+TELEGRAM_MAX_MESSAGES_PER_SECOND = 28
+TELEGRAM_MAX_GROUP_MESSAGES_PER_MINUTE = 19
+TELEGRAM_MAX_RETRIES = 3
+
+# One pooled HTTP/2 client for all Telegram calls: concurrent sends are multiplexed over a kept-alive
+# connection, and the pool is never smaller than the number of sends allowed in flight.
+# Initialized (getMe, request setup) by test_bot_connection and shut down when main_async exits.
+bot = ExtBot(
+    token=TOKEN,
+    request=HTTPXRequest(connection_pool_size=TELEGRAM_MAX_CONCURRENT_SENDS, pool_timeout=5.0, http_version="2"),
+    rate_limiter=AIORateLimiter(
+        overall_max_rate=TELEGRAM_MAX_MESSAGES_PER_SECOND, overall_time_period=1,
+        group_max_rate=TELEGRAM_MAX_GROUP_MESSAGES_PER_MINUTE, group_time_period=60,
+        max_retries=TELEGRAM_MAX_RETRIES
+    )
+)
 
 # File paths for custom messages and daily data storage
 MESSAGE_FILE_PATH = "bot_messages.txt"
 DAILY_DATA_FILE = "daily_prices.json"
+message_file_cache = {}  # file_path -> (st_mtime_ns, message); فایل فقط وقتی تغییر کرده دوباره خوانده می‌شود
+
+# Rolling price history is saved every cycle and restored on startup if younger than HISTORY_STATE_MAX_AGE,
+# so timeframe checks have real window starts right after a restart
+HISTORY_STATE_FILE = "price_history.json"
+HISTORY_STATE_MAX_AGE = 3600  # seconds
 
 # Thresholds for alerts
 PRICE_CHANGE_THRESHOLD = 5.0  # 5% price change
 VOLUME_CHANGE_THRESHOLD = 5.0  # 5% volume change
+ALERT_COOLDOWN = 180  # seconds between alerts for the same token, across all timeframes
 
 # Settings
 SEND_REGULAR_UPDATES = False  # حذف پیام‌های Price Update
 SEND_ONLY_PUMPS = False  # تغییر شد: False تا dump alert هم ارسال شود
 UPDATE_INTERVAL = 300
 CHECK_INTERVAL = 120  # Check API every 2 minutes (safe from rate limiting)
+FETCH_QUEUE_SIZE = 2  # Fetched cycles waiting to be processed before the fetcher waits
+FETCH_JITTER = 2.0  # seconds of random delay added to each poll so it does not line up with other clients
+MARKETS_PAGE_SIZE = 250  # Max ids per /coins/markets request
+
+# Display formats: PRICE_FORMATS[i] is used for prices below PRICE_FORMAT_BOUNDS[i] (last one above all bounds)
+PRICE_FORMAT_BOUNDS = (0.0001, 0.01, 1)
+PRICE_FORMATS = ("${:.10f}", "${:.8f}", "${:.6f}", "${:.4f}")
+CAP_FORMAT_BOUNDS = (1e6, 1e9)
+CAP_UNITS = ((1, ""), (1e6, "M"), (1e9, "B"))  # (divisor, suffix)
+
+# Price Update row marker by direction of the 24h change (np.sign of it); tokens without a change keep 💰
+CHANGE_EMOJIS = {1.0: "🟢", -1.0: "🔴"}
+
+# Alerts found in one cycle are joined into as few messages as Telegram's length limit allows
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+ALERT_SEPARATOR = "\n\n"
+ALERT_SEPARATOR_LENGTH = len(ALERT_SEPARATOR)
+
+# Alert message templates (filled with str.format_map; {details} holds the optional cap/daily lines)
+PUMP_TEMPLATE = (
+    "🚀 🟢🟢PUMP ALERT🟢🟢 🚀\n"
+    "⏰ Timeframe: {timeframe}\n"
+    "🔥 Token: #{symbol}\n"
+    "💰 Price: {price}\n"
+    "📈 Price Change: +{change:.2f}%\n"
+    "📊 Volume Change: {volume_change:+.2f}%\n"
+    "📊 24h Volume: ${volume:,.2f}"
+    "{details}\n"
+    "🎯 **TO THE MOON!** 🌙"
+)
+DUMP_TEMPLATE = (
+    "📉 🔴🔴DUMP ALERT🔴🔴 📉\n"
+    "⏰ Timeframe: {timeframe}\n"
+    "💔 Token: #{symbol}\n"
+    "💰 Price: {price}\n"
+    "📉 Price Change: {change:.2f}%\n"
+    "📊 Volume Change: {volume_change:+.2f}%\n"
+    "📊 24h Volume: ${volume:,.2f}"
+    "{details}\n"
+    "⚠️ **PRICE DROPPING!** ⚡️"
+)
 
 # Daily snapshot settings
 DAILY_SNAPSHOT_HOUR = 6  # ساعت 6 صبح برای snapshot روزانه
@@ -52,67 +146,133 @@ TIMEFRAMES = {
     "daily": 86400  # 24 hours in seconds (for reference, but handled differently)
 }
 
-# Storage for historical data for each timeframe
+# Fixed token order: price/volume vectors are indexed by position, CG_IDS[i] <-> SYMBOLS[i]
+CG_IDS = tuple(TOKENS.keys())
+SYMBOLS = tuple(TOKENS.values())
+# symbolها کلید daily_prices.json هستند؛ symbol تکراری baseline یک توکن را با دیگری قاطی می‌کند
+if len(set(SYMBOLS)) != len(SYMBOLS):
+    raise Exception("Duplicate symbols in TOKENS (tokens.py) - every token needs its own symbol.")
+CG_ID_IDX = {cg_id: i for i, cg_id in enumerate(CG_IDS)}
+SYMBOL_IDX = {symbol: i for i, symbol in enumerate(SYMBOLS)}
+
+# Query params for each /coins/markets request, built once (TOKENS does not change at runtime)
+MARKETS_URL = "https://api.coingecko.com/api/v3/coins/markets"
+MARKETS_PAGE_PARAMS = tuple(
+    {
+        "vs_currency": "usd",
+        "ids": ",".join(CG_IDS[start:start + MARKETS_PAGE_SIZE]),
+        "per_page": MARKETS_PAGE_SIZE,
+        "page": 1
+    }
+    for start in range(0, len(CG_IDS), MARKETS_PAGE_SIZE)
+)
+
+# Intraday timeframes in a fixed order; their state arrays are indexed by position (TF_IDX)
+INTRADAY_TIMEFRAMES = tuple(tf for tf in TIMEFRAMES if tf != "daily")
+TF_IDX = {tf: i for i, tf in enumerate(INTRADAY_TIMEFRAMES)}
+INTRADAY_SECONDS = np.array([TIMEFRAMES[tf] for tf in INTRADAY_TIMEFRAMES], dtype=np.float64)
+last_check_times = np.zeros(len(INTRADAY_TIMEFRAMES))
+
+# Time of the last delivered alert per token (indexed like SYMBOLS), for ALERT_COOLDOWN
+last_alert_times = np.zeros(len(SYMBOLS))
+
+# Daily snapshot state (intraday prices live in the history arrays below)
 timeframe_data = {
-    "3min": {"prices": {}, "volumes": {}, "last_check": 0},
-    "5min": {"prices": {}, "volumes": {}, "last_check": 0},
-    "15min": {"prices": {}, "volumes": {}, "last_check": 0},
-    "daily": {"prices": {}, "volumes": {}, "last_snapshot": 0, "snapshot_date": ""}
+    "daily": {"prices": {}, "volumes": {}, "price_vector": np.full(len(SYMBOLS), np.nan),
+              "last_snapshot": 0, "snapshot_date": ""}
 }
 
-last_update_time = 0
-startup_time = time.time()
+# Rolling history, one row per check cycle shared by all intraday timeframes.
+# Rows not filled yet have timestamp 0 and NaN prices. Sized to hold the longest timeframe plus one spare cycle.
+# Ring buffer with every row written twice (at pos and pos + HISTORY_SIZE), so history_window() is always a
+# contiguous, oldest-first view without copying the whole history on each append.
+# Samples closer than MIN_SAMPLE_INTERVAL to the newest row are not recorded (downsampling on write): at least
+# 6 samples per smallest timeframe, far below the poll spacing, so slow fetches never get a poll dropped.
+# The ring is sized for rows this dense, so it always spans the longest timeframe.
+MIN_SAMPLE_INTERVAL = max(1.0, INTRADAY_SECONDS.min() / 6)
+HISTORY_SIZE = int(INTRADAY_SECONDS.max() // MIN_SAMPLE_INTERVAL) + 2
+history_times = np.zeros(2 * HISTORY_SIZE)
+price_history = np.full((2 * HISTORY_SIZE, len(SYMBOLS)), np.nan)
+volume_history = np.full((2 * HISTORY_SIZE, len(SYMBOLS)), np.nan)
+history_intervals = np.full(2 * HISTORY_SIZE, float(CHECK_INTERVAL))  # poll interval in effect for each row
+history_pos = 0  # ردیف بعدی برای نوشتن = قدیمی‌ترین ردیف پنجره
 
-def get_daily_snapshot_time():
-    """محاسبه زمان snapshot روزانه (ساعت 6 صبح)"""
-    now = datetime.now()
-    today_snapshot = now.replace(hour=DAILY_SNAPSHOT_HOUR, minute=DAILY_SNAPSHOT_MINUTE, second=0, microsecond=0)
-    
-    # اگر هنوز به ساعت 6 امروز نرسیده، از دیروز استفاده کن
-    if now < today_snapshot:
-        yesterday_snapshot = today_snapshot - timedelta(days=1)
-        return yesterday_snapshot
-    else:
-        return today_snapshot
+# Shared async HTTP client for CoinGecko (created in main_async on the running loop).
+# Kept-alive connections are reused across cycles, so each poll skips the TCP/TLS handshake.
+HTTP_TIMEOUT = 15  # seconds, for reading the response
+HTTP_CONNECT_TIMEOUT = 3.05  # seconds; an unreachable host fails fast and goes to the retry backoff
+HTTP_HEADERS = {"User-Agent": "CoinAlertBot/1.0", "Accept": "application/json"}
+HTTP_MAX_CONNECTIONS = 10
+HTTP_KEEPALIVE_EXPIRY = CHECK_INTERVAL + 30  # seconds; idle connections must outlive the gap between polls
+http_client = None
+
+# Last (ETag, coins) per /coins/markets page; unchanged pages come back as an empty 304
+markets_page_cache = {}
+
+# After a 429, CoinGecko is not polled again until this time.monotonic() value (from the Retry-After header)
+DEFAULT_RETRY_AFTER = 60
+rate_limited_until = 0
+
+# Polling slows down while CoinGecko reports few requests left in its window (X-RateLimit-Remaining)
+RATE_LIMIT_LOW_REMAINING = 5
+RATE_LIMIT_SLOW_INTERVAL = CHECK_INTERVAL * 2
+poll_interval = CHECK_INTERVAL
+
+# Transient network errors (timeouts, dropped connections) are retried with exponential backoff
+FETCH_RETRY_ATTEMPTS = 3
+FETCH_RETRY_BASE_DELAY = 2  # seconds; doubles after every failed attempt
+FETCH_RETRY_MAX_DELAY = 60
+FETCH_RETRY_STATUSES = frozenset({500, 502, 503, 504})  # 429 جداگانه با Retry-After مدیریت می‌شود
+
+# A window start may be at most one poll interval (as recorded for the rows around it) plus this margin before
+# its sample: jitter and one retried fetch shift samples a little, a missing row shifts them a whole interval
+WINDOW_GAP_MARGIN = FETCH_JITTER + FETCH_RETRY_BASE_DELAY + HTTP_CONNECT_TIMEOUT
+
+# When a fetch fails or is skipped, the last good (fetch time, monotonic fetch time, Snapshot) is reused
+# for up to this many seconds.
+# A reused snapshot still drives the daily snapshot and regular updates, but never alerts or price history.
+STALE_SNAPSHOT_MAX_AGE = 300
+last_good_snapshot = None
+
+# مدت‌های داخل پروسه با time.monotonic سنجیده می‌شوند (تغییر ساعت سیستم روی آن‌ها اثر ندارد)؛
+# زمان‌هایی که ذخیره یا با history مقایسه می‌شوند wall-clock (time.time) می‌مانند
+last_update_time = float("-inf")  # time.monotonic() of the last regular update
+startup_time = time.time()
 
 def should_take_daily_snapshot():
     """چک کردن اینکه آیا نیاز به snapshot روزانه هست یا نه"""
-    daily_data = timeframe_data["daily"]
+    last_snapshot = timeframe_data["daily"]["last_snapshot"]
     current_time = datetime.now()
     
     # اگر هیچ snapshot قبلی نداریم
-    if daily_data["last_snapshot"] == 0:
+    if last_snapshot == 0:
         return True
     
-    # اگر تاریخ snapshot تغییر کرده (روز جدید)
-    last_snapshot_date = datetime.fromtimestamp(daily_data["last_snapshot"]).date()
-    snapshot_time = get_daily_snapshot_time()
-    
     # اگر از آخرین snapshot بیش از 24 ساعت گذشته و به ساعت مناسب رسیده‌ایم
-    time_since_snapshot = time.time() - daily_data["last_snapshot"]
+    time_since_snapshot = time.time() - last_snapshot
     current_hour = current_time.hour
     current_minute = current_time.minute
     
     # چک کن که آیا در بازه مناسب برای snapshot هستیم (6:00 تا 6:30 صبح)
     is_snapshot_time = (current_hour == DAILY_SNAPSHOT_HOUR and 0 <= current_minute <= 30)
     
-    return (time_since_snapshot >= 86400 and is_snapshot_time) or daily_data["last_snapshot"] == 0
+    return time_since_snapshot >= 86400 and is_snapshot_time
 
-def save_daily_snapshot(current_data):
+def save_daily_snapshot(snapshot):
     """ذخیره snapshot روزانه"""
     try:
-        import json
-        
         daily_data = timeframe_data["daily"]
+        daily_prices = daily_data["prices"]
+        daily_volumes = daily_data["volumes"]
         current_time = time.time()
         current_date = datetime.now().strftime("%Y-%m-%d")
         
         # آپدیت کردن داده‌های daily در memory
-        for symbol, data in current_data.items():
-            if symbol != "_total_market_cap":
-                daily_data["prices"][symbol] = data["price"]
-                daily_data["volumes"][symbol] = data["volume"]
+        for i in np.flatnonzero(np.isfinite(snapshot.prices)):
+            daily_prices[SYMBOLS[i]] = float(snapshot.prices[i])
+            daily_volumes[SYMBOLS[i]] = float(snapshot.volumes[i])
         
+        daily_data["price_vector"] = build_price_vector(daily_prices)
         daily_data["last_snapshot"] = current_time
         daily_data["snapshot_date"] = current_date
         
@@ -120,85 +280,142 @@ def save_daily_snapshot(current_data):
         daily_snapshot = {
             "date": current_date,
             "timestamp": current_time,
-            "prices": daily_data["prices"].copy(),
-            "volumes": daily_data["volumes"].copy(),
-            "total_market_cap": current_data.get("_total_market_cap", 0)
+            "prices": daily_prices,
+            "volumes": daily_volumes,
+            "total_market_cap": snapshot.total_market_cap
         }
         
-        with open(DAILY_DATA_FILE, 'w') as f:
-            json.dump(daily_snapshot, f, indent=2)
+        # نوشتن در فایل موقت و جایگزینی atomic تا crash وسط نوشتن فایل خراب باقی نگذارد
+        tmp_path = DAILY_DATA_FILE + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(daily_snapshot))
+        os.replace(tmp_path, DAILY_DATA_FILE)
         
-        print(f"📅 Daily snapshot saved for {current_date} at {datetime.fromtimestamp(current_time).strftime('%H:%M:%S')}")
+        log.info(f"📅 Daily snapshot saved for {current_date} at {datetime.fromtimestamp(current_time).strftime('%H:%M:%S')}")
         return True
         
     except Exception as e:
-        print(f"❌ Error saving daily snapshot: {e}")
+        log.error(f"❌ Error saving daily snapshot: {e}")
         return False
 
 def load_daily_snapshot():
     """لود کردن snapshot روزانه از فایل"""
     try:
-        import json
-        
         if not os.path.exists(DAILY_DATA_FILE):
-            print(f"📅 Daily snapshot file ({DAILY_DATA_FILE}) not found")
-            print("💡 Please create the file manually or wait for the first 6AM snapshot")
+            log.info(f"📅 Daily snapshot file ({DAILY_DATA_FILE}) not found")
+            log.info("💡 Please create the file manually or wait for the first 6AM snapshot")
             return False
         
-        with open(DAILY_DATA_FILE, 'r') as f:
-            daily_snapshot = json.load(f)
+        with open(DAILY_DATA_FILE, 'rb') as f:
+            daily_snapshot = orjson.loads(f.read())
         
         # بررسی صحت فرمت فایل
         required_keys = ["date", "timestamp", "prices", "volumes"]
         for key in required_keys:
             if key not in daily_snapshot:
-                print(f"❌ Invalid format in {DAILY_DATA_FILE}: missing '{key}' key")
+                log.error(f"❌ Invalid format in {DAILY_DATA_FILE}: missing '{key}' key")
                 return False
         
         daily_data = timeframe_data["daily"]
         daily_data["prices"] = daily_snapshot.get("prices", {})
         daily_data["volumes"] = daily_snapshot.get("volumes", {})
+        daily_data["price_vector"] = build_price_vector(daily_data["prices"])
         daily_data["last_snapshot"] = daily_snapshot.get("timestamp", 0)
         daily_data["snapshot_date"] = daily_snapshot.get("date", "")
         
-        print(f"✅ Daily snapshot loaded: {daily_data['snapshot_date']} ({len(daily_data['prices'])} tokens)")
+        log.info(f"✅ Daily snapshot loaded: {daily_data['snapshot_date']} ({len(daily_data['prices'])} tokens)")
         return True
         
-    except json.JSONDecodeError as e:
-        print(f"❌ Invalid JSON format in {DAILY_DATA_FILE}: {e}")
-        print("💡 Please check the file format or delete it to start fresh")
+    except orjson.JSONDecodeError as e:
+        log.error(f"❌ Invalid JSON format in {DAILY_DATA_FILE}: {e}")
+        log.info("💡 Please check the file format or delete it to start fresh")
         return False
     except Exception as e:
-        print(f"❌ Error loading daily snapshot: {e}")
+        log.error(f"❌ Error loading daily snapshot: {e}")
         return False
 
-def get_daily_changes(current_data):
-    """محاسبه تغییرات روزانه نسبت به snapshot ساعت 6 صبح"""
-    daily_data = timeframe_data["daily"]
-    changes = {}
-    
-    if not daily_data["prices"]:
-        return {}
-    
-    for symbol, current_info in current_data.items():
-        if symbol == "_total_market_cap":
-            continue
+def save_price_history_state():
+    """ذخیره history قیمت‌ها برای ادامه بعد از restart (نوشتن atomic)"""
+    try:
+        times, prices, volumes, intervals = history_window()
+        state = {
+            "saved_at": time.time(),
+            "ids": CG_IDS,
+            "times": times,
+            "prices": prices,
+            "volumes": volumes,
+            "intervals": intervals
+        }
+        tmp_path = HISTORY_STATE_FILE + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(state, option=orjson.OPT_SERIALIZE_NUMPY))  # NaN -> null
+        os.replace(tmp_path, HISTORY_STATE_FILE)
+        return True
+    except Exception as e:
+        log.error(f"❌ Error saving price history state: {e}")
+        return False
+
+def load_price_history_state():
+    """لود کردن history قیمت‌ها از اجرای قبلی، اگر از HISTORY_STATE_MAX_AGE قدیمی‌تر نباشد"""
+    global startup_time
+    try:
+        if not os.path.exists(HISTORY_STATE_FILE):
+            return False
         
-        current_price = current_info["price"]
-        daily_price = daily_data["prices"].get(symbol)
+        with open(HISTORY_STATE_FILE, 'rb') as f:
+            state = orjson.loads(f.read())
         
-        if daily_price is not None and daily_price > 0:
-            try:
-                daily_change = ((current_price - daily_price) / daily_price) * 100
-                changes[symbol] = {
-                    "daily_change": daily_change,
-                    "daily_price": daily_price,
-                    "current_price": current_price
-                }
-            except ZeroDivisionError:
-                continue
-    
-    return changes
+        age = time.time() - state["saved_at"]
+        if age > HISTORY_STATE_MAX_AGE:
+            log.info(f"🗂️ Price history state is {age/60:.0f} min old - starting with empty history")
+            return False
+        
+        # ستون‌ها با CoinGecko id به ترتیب فعلی SYMBOLS نگاشت می‌شوند (ممکن است TOKENS عوض شده باشد)
+        columns = [(CG_ID_IDX[cg_id], j) for j, cg_id in enumerate(state["ids"]) if cg_id in CG_ID_IDX]
+        rows = min(len(state["times"]), HISTORY_SIZE)
+        if not columns or not rows:
+            return False
+        dst, src = (np.array(idx) for idx in zip(*columns))
+        
+        times = np.array(state["times"][-rows:], dtype=np.float64)
+        prices = np.full((rows, len(SYMBOLS)), np.nan)
+        volumes = np.full((rows, len(SYMBOLS)), np.nan)
+        prices[:, dst] = np.array(state["prices"][-rows:], dtype=np.float64)[:, src]  # null -> NaN
+        volumes[:, dst] = np.array(state["volumes"][-rows:], dtype=np.float64)[:, src]
+        # فایل‌های قدیمی‌تر intervals ندارند؛ آن موقع poll همیشه CHECK_INTERVAL بود
+        intervals = np.array(state.get("intervals", [CHECK_INTERVAL] * rows)[-rows:], dtype=np.float64)
+        for row in range(rows):
+            record_price_history(prices[row], volumes[row], times[row], intervals[row])
+        
+        # با history بازیابی‌شده لازم نیست بعد از startup یک تایم‌فریم کامل صبر کنیم
+        filled = times[times > 0]
+        if len(filled):
+            startup_time = min(startup_time, filled.min())
+        
+        log.info(f"🗂️ Restored {len(filled)} price history samples ({age:.0f}s old)")
+        return True
+        
+    except (orjson.JSONDecodeError, KeyError, ValueError, TypeError) as e:
+        log.error(f"❌ Invalid price history state in {HISTORY_STATE_FILE}: {e}")
+        return False
+    except Exception as e:
+        log.error(f"❌ Error loading price history state: {e}")
+        return False
+
+def build_price_vector(values_by_symbol):
+    """تبدیل dict قیمت‌ها (symbol -> value) به vector هم‌ترتیب با SYMBOLS (NaN برای توکن‌های بدون داده)"""
+    return np.array([values_by_symbol.get(symbol, np.nan) for symbol in SYMBOLS], dtype=np.float64)
+
+def percent_change(current, previous, valid, fill=0.0):
+    """(current - previous) / previous * 100, divided only where valid is True; other entries are fill (broadcasts)"""
+    out = np.full(np.broadcast(current, previous).shape, fill, dtype=np.float64)
+    return np.divide((current - previous) * 100, previous, out=out, where=valid)
+
+def get_daily_changes(prices):
+    """محاسبه تغییرات روزانه (درصد) نسبت به snapshot ساعت 6 صبح؛ NaN برای توکن‌های بدون baseline"""
+    daily_prices = timeframe_data["daily"]["price_vector"]
+    valid = np.isfinite(daily_prices) & (daily_prices > 0) & (prices > 0)
+    return percent_change(prices, daily_prices, valid, fill=np.nan)
 
 def read_message_from_file(file_path):
     """
@@ -206,296 +423,354 @@ def read_message_from_file(file_path):
     اگر فایل وجود نداشته باشد یا خالی باشد، None برمی‌گرداند
     """
     try:
-        if os.path.exists(file_path):
+        try:
+            mtime = os.stat(file_path).st_mtime_ns
+        except FileNotFoundError:
+            log.info(f"📄 File {file_path} does not exist, no message to send")
+            return None
+        
+        cached = message_file_cache.get(file_path)
+        if cached and cached[0] == mtime:
+            message = cached[1]
+        else:
             with open(file_path, 'r', encoding='utf-8') as file:
                 message = file.read().strip()
-                if message:
-                    return message
-                else:
-                    print(f"📄 File {file_path} is empty, no message to send")
-                    return None
+            message_file_cache[file_path] = (mtime, message)
+        
+        if message:
+            return message
         else:
-            print(f"📄 File {file_path} does not exist, no message to send")
+            log.info(f"📄 File {file_path} is empty, no message to send")
             return None
     except Exception as e:
-        print(f"❌ Error reading message file {file_path}: {e}")
+        log.error(f"❌ Error reading message file {file_path}: {e}")
         return None
 
-def get_detailed_market_cap(token_id):
-    """
-    دریافت market cap دقیق از endpoint کامل‌تر API
-    """
-    url = f"https://api.coingecko.com/api/v3/coins/{token_id}"
-    
-    params = {
-        'localization': 'false',
-        'tickers': 'false',
-        'market_data': 'true',
-        'community_data': 'false',
-        'developer_data': 'false',
-        'sparkline': 'false'
-    }
-    
+def get_retry_after(response):
+    """Seconds to wait according to the Retry-After header (DEFAULT_RETRY_AFTER if missing or not numeric)"""
     try:
-        response = requests.get(url, params=params, timeout=10)
-        if response.status_code == 200:
-            data = response.json()
-            market_cap = data.get('market_data', {}).get('market_cap', {}).get('usd')
-            return float(market_cap) if market_cap else None
-        return None
-    except:
+        return max(int(response.headers.get("Retry-After", DEFAULT_RETRY_AFTER)), 0)
+    except ValueError:
+        return DEFAULT_RETRY_AFTER
+
+@dataclass(slots=True)
+class Snapshot:
+    """One CoinGecko poll as vectors aligned to SYMBOLS (NaN where a token had no data)"""
+    prices: np.ndarray
+    volumes: np.ndarray
+    market_caps: np.ndarray  # 0 where CoinGecko has no market cap
+    changes_24h: np.ndarray  # CoinGecko rolling 24h change (%)
+    total_market_cap: float
+    token_count: int
+
+def get_rate_limit_remaining(response):
+    """Requests left according to the X-RateLimit-Remaining header, or None if missing or not numeric"""
+    try:
+        return int(response.headers["X-RateLimit-Remaining"])
+    except (KeyError, ValueError):
         return None
 
-def get_all_prices_and_volumes():
-    """Fetch all token prices and volumes in a single API call"""
-    url = "https://api.coingecko.com/api/v3/simple/price"
+def update_poll_interval(responses):
+    """Slow polling down to RATE_LIMIT_SLOW_INTERVAL while the remaining request budget is low"""
+    global poll_interval
+    remaining = [r for r in map(get_rate_limit_remaining, responses) if r is not None]
+    if not remaining:
+        return
     
-    # Validate TOKENS dictionary
-    if not TOKENS:
-        print("❌ TOKENS dictionary is empty")
-        return {}
+    new_interval = RATE_LIMIT_SLOW_INTERVAL if min(remaining) < RATE_LIMIT_LOW_REMAINING else CHECK_INTERVAL
+    if new_interval != poll_interval:
+        log.warning(f"⚠️ CoinGecko requests remaining: {min(remaining)} - polling every {new_interval}s")
+        poll_interval = new_interval
+
+async def get_markets_page(params):
+    """GET one /coins/markets page, retrying transient network errors and 5xx responses with exponential backoff"""
+    page_ids = params["ids"]
+    headers = {"If-None-Match": markets_page_cache[page_ids][0]} if page_ids in markets_page_cache else None
     
-    token_ids = ",".join(TOKENS.keys())
+    for attempt in range(FETCH_RETRY_ATTEMPTS):
+        last_attempt = attempt == FETCH_RETRY_ATTEMPTS - 1
+        delay = min(FETCH_RETRY_BASE_DELAY * 2 ** attempt, FETCH_RETRY_MAX_DELAY)
+        try:
+            response = await http_client.get(MARKETS_URL, params=params, headers=headers)
+        except httpx.TransportError as e:
+            if last_attempt:
+                raise
+            log.info(f"🔄 Network error fetching prices ({e!r}), retrying in {delay}s...")
+        else:
+            # خطای سرور بعد از آخرین تلاش به caller برمی‌گردد تا مثل قبل گزارش شود
+            if response.status_code not in FETCH_RETRY_STATUSES or last_attempt:
+                return response
+            log.info(f"🔄 CoinGecko returned {response.status_code}, retrying in {delay}s...")
+        await asyncio.sleep(delay)
+
+def market_column(coins, key):
+    """Return one field of the /coins/markets coins as a float64 array (missing or null -> NaN)"""
+    return np.array([coin.get(key) for coin in coins], dtype=np.float64)
+
+async def get_all_prices_and_volumes():
+    """Fetch price, volume, market cap and 24h change for all tokens via /coins/markets; returns a Snapshot or None"""
+    global rate_limited_until
     
-    params = {
-        "ids": token_ids,
-        "vs_currencies": "usd",
-        "include_24hr_vol": "true",
-        "include_market_cap": "true"
-    }
+    # Validate TOKENS dictionary
+    if not TOKENS:
+        log.error("❌ TOKENS dictionary is empty")
+        return None
     
     try:
-        print(f"🌐 Requesting data from CoinGecko API...")
-        response = requests.get(url, params=params, timeout=15)
-        response.raise_for_status()
-        data = response.json()
-        
-        if not data:
-            print("⚠️ Empty response from API")
-            return {}
-        
-        results = {}
-        total_market_cap = 0
-        
-        # First pass: get basic data
-        for cg_id, symbol in TOKENS.items():
-            if cg_id in data:
-                token_data = data[cg_id]
-                price = token_data.get("usd")
-                volume = token_data.get("usd_24h_vol")
-                
-                if price is not None and volume is not None:
-                    results[symbol] = {
-                        "price": float(price),
-                        "volume": float(volume),
-                        "market_cap": 0,  # Will be updated
-                        "cg_id": cg_id
-                    }
-                else:
-                    print(f"⚠️ Missing price or volume data for {symbol}")
-            else:
-                print(f"⚠️ No data returned for {symbol} ({cg_id})")
+        log.info(f"🌐 Requesting data from CoinGecko API...")
+        # /coins/markets returns at most MARKETS_PAGE_SIZE ids per call, so pages are fetched concurrently
+        page_requests = [get_markets_page(params) for params in MARKETS_PAGE_PARAMS]
         
-        # Second pass: get accurate market caps using detailed endpoint
-        print("📊 Fetching accurate market cap data...")
-        for symbol, token_info in results.items():
-            cg_id = token_info["cg_id"]
-            detailed_market_cap = get_detailed_market_cap(cg_id)
-            
-            if detailed_market_cap:
-                token_info["market_cap"] = detailed_market_cap
-                total_market_cap += detailed_market_cap
-                print(f"✅ {symbol}: Market Cap = ${detailed_market_cap:,.2f}")
+        prices = np.full(len(SYMBOLS), np.nan)
+        volumes = np.full(len(SYMBOLS), np.nan)
+        market_caps = np.zeros(len(SYMBOLS))
+        changes_24h = np.full(len(SYMBOLS), np.nan)
+        returned = np.zeros(len(SYMBOLS), dtype=bool)
+        
+        responses = await asyncio.gather(*page_requests)
+        update_poll_interval(responses)
+        
+        coins = []
+        for params, response in zip(MARKETS_PAGE_PARAMS, responses):
+            page_ids = params["ids"]
+            if response.status_code == 304 and page_ids in markets_page_cache:
+                # صفحه تغییری نکرده - از پاسخ قبلی استفاده کن
+                page_coins = markets_page_cache[page_ids][1]
             else:
-                # Fallback to simple API market cap if detailed fails
-                simple_market_cap = data.get(cg_id, {}).get("usd_market_cap")
-                if simple_market_cap:
-                    token_info["market_cap"] = float(simple_market_cap)
-                    total_market_cap += float(simple_market_cap)
-                    print(f"⚠️ {symbol}: Using fallback Market Cap = ${float(simple_market_cap):,.2f}")
-            
-            # Small delay to avoid rate limiting
-            time.sleep(0.1)
+                response.raise_for_status()
+                page_coins = orjson.loads(response.content)
+                etag = response.headers.get("ETag")
+                if etag:
+                    markets_page_cache[page_ids] = (etag, page_coins)
+            coins.extend(coin for coin in page_coins if coin["id"] in CG_ID_IDX)
         
-        # Add total market cap to results
-        if results:
-            results["_total_market_cap"] = total_market_cap
+        # ستون‌های پاسخ یک‌جا به array تبدیل و با یک mask اعتبارسنجی می‌شوند (None -> NaN)
+        idx = np.fromiter((CG_ID_IDX[coin["id"]] for coin in coins), dtype=np.intp, count=len(coins))
+        returned[idx] = True
+        coin_prices = market_column(coins, "current_price")
+        coin_volumes = market_column(coins, "total_volume")
+        ok = np.isfinite(coin_prices) & (coin_prices > 0) & np.isfinite(coin_volumes) & (coin_volumes >= 0)
+        prices[idx[ok]] = coin_prices[ok]
+        volumes[idx[ok]] = coin_volumes[ok]
+        market_caps[idx[ok]] = np.nan_to_num(market_column(coins, "market_cap")[ok])
+        changes_24h[idx[ok]] = market_column(coins, "price_change_percentage_24h")[ok]
         
-        print(f"✅ Successfully fetched data for {len(results)-1} tokens")  # -1 for _total_market_cap
-        print(f"💰 Total Market Cap: ${total_market_cap:,.2f}")
-        return results
+        if not returned.any():
+            log.warning("⚠️ Empty response from API")
+            return None
         
-    except requests.exceptions.Timeout:
-        print("⛔ Request timeout while fetching prices (15s)")
-        return {}
-    except requests.exceptions.HTTPError as e:
+        # یک خط خلاصه برای توکن‌های بدون داده؛ جزئیات هر توکن فقط در DEBUG
+        not_returned = np.flatnonzero(~returned)
+        incomplete = np.flatnonzero(returned & np.isnan(prices))
+        if len(not_returned) or len(incomplete):
+            log.warning(f"⚠️ {len(not_returned)} tokens not returned, {len(incomplete)} without valid price or volume")
+            for i in not_returned:
+                log.debug(f"⚠️ No data returned for {SYMBOLS[i]} ({CG_IDS[i]})")
+            for i in incomplete:
+                log.debug(f"⚠️ Missing or invalid price/volume data for {SYMBOLS[i]}")
+        
+        token_count = int(np.count_nonzero(~np.isnan(prices)))
+        if not token_count:
+            log.warning("⚠️ No usable token data in API response")
+            return None
+        
+        total_market_cap = float(market_caps.sum())
+        log.info(f"✅ Successfully fetched data for {token_count} tokens")
+        log.info(f"💰 Total Market Cap: ${total_market_cap:,.2f}")
+        return Snapshot(prices, volumes, market_caps, changes_24h, total_market_cap, token_count)
+        
+    except httpx.TimeoutException:
+        log.error(f"⛔ Request timeout while fetching prices ({HTTP_TIMEOUT}s)")
+        return None
+    except httpx.HTTPStatusError as e:
         if e.response.status_code == 429:
-            print("⛔ Rate limited by API. Increase CHECK_INTERVAL!")
+            retry_after = get_retry_after(e.response)
+            rate_limited_until = time.monotonic() + retry_after
+            log.error(f"⛔ Rate limited by API, backing off for {retry_after}s")
         else:
-            print(f"⛔ HTTP error fetching prices: {e}")
-        return {}
-    except requests.exceptions.RequestException as e:
-        print(f"⛔ Network error fetching prices: {e}")
-        return {}
+            log.error(f"⛔ HTTP error fetching prices: {e}")
+        return None
+    except httpx.RequestError as e:
+        log.error(f"⛔ Network error fetching prices: {e}")
+        return None
     except Exception as e:
-        print(f"⛔ Unexpected error fetching prices: {e}")
-        return {}
+        log.error(f"⛔ Unexpected error fetching prices: {e}")
+        return None
 
-async def send_to_all_chats(message, parse_mode=None):
-    """Send message to all chat IDs with better error handling"""
-    success_count = 0
-    failed_chats = []
+async def send_to_chat(chat_id, message, parse_mode=None):
+    """Send message to a single chat; returns True on success"""
+    # اعتبارسنجی chat_id
+    if not chat_id.strip():
+        log.warning(f"⚠️ Empty chat ID, skipping")
+        return False
     
-    for chat_id in CHAT_IDS:
+    # محدودیت نرخ ارسال (کل bot و هر گروه) را AIORateLimiter خود bot اعمال می‌کند
+    async with telegram_semaphore:
         try:
-            # اعتبارسنجی chat_id
-            if not chat_id.strip():
-                print(f"⚠️ Empty chat ID, skipping")
-                continue
-                
             if parse_mode:
                 await bot.send_message(chat_id=chat_id, text=message, parse_mode=parse_mode)
             else:
                 await bot.send_message(chat_id=chat_id, text=message)
-            success_count += 1
-            # افزایش تاخیر برای جلوگیری از rate limiting
-            await asyncio.sleep(0.2)
+            return True
         except Exception as e:
-            print(f"❌ Failed to send message to {chat_id}: {e}")
-            failed_chats.append(chat_id)
+            log.error(f"❌ Failed to send message to {chat_id}: {e}")
+            return False
+
+async def send_to_all_chats(message, parse_mode=None):
+    """Send message to all chat IDs concurrently with better error handling"""
+    results = await asyncio.gather(*(send_to_chat(chat_id, message, parse_mode) for chat_id in CHAT_IDS))
+    success_count = sum(results)
+    failed_chats = [chat_id for chat_id, ok in zip(CHAT_IDS, results) if not ok and chat_id.strip()]
     
-    print(f"📤 Message sent to {success_count}/{len(CHAT_IDS)} chats")
+    log.info(f"📤 Message sent to {success_count}/{len(CHAT_IDS)} chats")
     if failed_chats:
-        print(f"❌ Failed chats: {failed_chats}")
+        log.error(f"❌ Failed chats: {failed_chats}")
     
     return success_count > 0
 
-async def send_price_alert(symbol, price, change_percent, volume, volume_change_percent, timeframe, market_cap=None, total_market_cap=None, daily_change=None):
-    """Send pump or dump alert to all Telegram chats with timeframe info, market cap, and daily changes"""
+def format_price(price):
+    """فرمت قیمت با تعداد رقم اعشار متناسب با مقدار آن (lookup در جدول به جای if/elif)"""
+    return PRICE_FORMATS[bisect_right(PRICE_FORMAT_BOUNDS, price)].format(price)
+
+def format_cap(value):
+    """فرمت market cap به صورت $1.23B / $4.56M / $789"""
+    divisor, suffix = CAP_UNITS[bisect_right(CAP_FORMAT_BOUNDS, value)]
+    if suffix:
+        return f"${value/divisor:.2f}{suffix}"
+    return f"${value:,.0f}"
+
+def format_total_cap_line(total_market_cap):
+    """خط Total Portfolio Cap برای alertها - یک بار در هر cycle ساخته می‌شود"""
+    if total_market_cap and total_market_cap > 0:
+        return f"\n🏆 Total Portfolio Cap: {format_cap(total_market_cap)}"
+    return ""
+
+def build_price_alert(symbol, price, change_percent, volume, volume_change_percent, timeframe, market_cap=None,
+                      total_market_cap_text="", daily_change=None, change_24h=None, snapshot_date="today"):
+    """
+    Build a pump or dump alert with timeframe info, market cap, and daily changes.
+    total_market_cap_text and snapshot_date are shared by every alert in a cycle and passed in precomputed.
+    Returns (symbol, timeframe, alert_type, message), or None for invalid data.
+    """
     
     # اعتبارسنجی ورودی‌ها
     if not symbol or price <= 0:
-        print(f"❌ Invalid data for alert: symbol={symbol}, price={price}")
-        return False
-    
-    # تعیین فرمت قیمت بر اساس مقدار
-    if price < 0.0001:
-        price_format = f"${price:.10f}"
-    elif price < 0.01:
-        price_format = f"${price:.8f}"
-    elif price < 1:
-        price_format = f"${price:.6f}"
-    else:
-        price_format = f"${price:.4f}"
+        log.error(f"❌ Invalid data for alert: symbol={symbol}, price={price}")
+        return None
     
     # فرمت market cap
     market_cap_text = ""
     if market_cap and market_cap > 0:
-        if market_cap >= 1e9:
-            market_cap_text = f"\n💎 Market Cap: ${market_cap/1e9:.2f}B"
-        elif market_cap >= 1e6:
-            market_cap_text = f"\n💎 Market Cap: ${market_cap/1e6:.2f}M"
-        else:
-            market_cap_text = f"\n💎 Market Cap: ${market_cap:,.0f}"
-    
-    # فرمت total market cap
-    total_market_cap_text = ""
-    if total_market_cap and total_market_cap > 0:
-        if total_market_cap >= 1e9:
-            total_market_cap_text = f"\n🏆 Total Portfolio Cap: ${total_market_cap/1e9:.2f}B"
-        elif total_market_cap >= 1e6:
-            total_market_cap_text = f"\n🏆 Total Portfolio Cap: ${total_market_cap/1e6:.2f}M"
-        else:
-            total_market_cap_text = f"\n🏆 Total Portfolio Cap: ${total_market_cap:,.0f}"
+        market_cap_text = f"\n💎 Market Cap: {format_cap(market_cap)}"
     
     # فرمت daily change
     daily_change_text = ""
     if daily_change is not None:
-        daily_data = timeframe_data["daily"]
-        snapshot_date = daily_data.get("snapshot_date", "today")
         if daily_change > 0:
             daily_change_text = f"\n📅 24h Change (since {snapshot_date} 6AM): +{daily_change:.2f}%"
         else:
             daily_change_text = f"\n📅 24h Change (since {snapshot_date} 6AM): {daily_change:.2f}%"
+    elif change_24h is not None:
+        # بدون snapshot روزانه، از تغییر 24 ساعته CoinGecko استفاده کن
+        daily_change_text = f"\n📅 24h Change (rolling): {change_24h:+.2f}%"
     
     if change_percent > 0:
-        # Pump Alert
-        msg = (
-            f"🚀 🟢🟢PUMP ALERT🟢🟢 🚀\n"
-            f"⏰ Timeframe: {timeframe}\n"
-            f"🔥 Token: #{symbol}\n"
-            f"💰 Price: {price_format}\n"
-            f"📈 Price Change: +{change_percent:.2f}%\n"
-            f"📊 Volume Change: {volume_change_percent:+.2f}%\n"
-            f"📊 24h Volume: ${volume:,.2f}"
-            f"{market_cap_text}"
-            f"{total_market_cap_text}"
-            f"{daily_change_text}\n"
-            f"🎯 **TO THE MOON!** 🌙"
-        )
-        alert_type = "PUMP"
+        template, alert_type = PUMP_TEMPLATE, "PUMP"
     else:
-        # Dump Alert
-        msg = (
-            f"📉 🔴🔴DUMP ALERT🔴🔴 📉\n"
-            f"⏰ Timeframe: {timeframe}\n"
-            f"💔 Token: #{symbol}\n"
-            f"💰 Price: {price_format}\n"
-            f"📉 Price Change: {change_percent:.2f}%\n"
-            f"📊 Volume Change: {volume_change_percent:+.2f}%\n"
-            f"📊 24h Volume: ${volume:,.2f}"
-            f"{market_cap_text}"
-            f"{total_market_cap_text}"
-            f"{daily_change_text}\n"
-            f"⚠️ **PRICE DROPPING!** ⚡️"
-        )
-        alert_type = "DUMP"
+        template, alert_type = DUMP_TEMPLATE, "DUMP"
     
-    try:
-        success = await send_to_all_chats(msg)
-        if success:
-            print(f"📤 {alert_type} alert sent for {symbol} ({timeframe})")
-        return success
-    except Exception as e:
-        print(f"❌ Error sending {alert_type} alert for {symbol}: {e}")
-        return False
+    msg = template.format_map({
+        "timeframe": timeframe,
+        "symbol": symbol,
+        "price": format_price(price),
+        "change": change_percent,
+        "volume_change": volume_change_percent,
+        "volume": volume,
+        "details": market_cap_text + total_market_cap_text + daily_change_text
+    })
+    
+    return symbol, timeframe, alert_type, msg
+
+def telegram_length(text):
+    """Message length as Telegram counts it (UTF-16 code units, so most emoji count as 2)"""
+    return len(text.encode("utf-16-le")) // 2
+
+def batch_alerts(alerts):
+    """Group alerts, in order, into batches whose joined text fits in one Telegram message"""
+    batches = []
+    batch, length = [], 0
+    for alert in alerts:
+        alert_length = telegram_length(alert[3])
+        if batch and length + ALERT_SEPARATOR_LENGTH + alert_length > TELEGRAM_MAX_MESSAGE_LENGTH:
+            batches.append(batch)
+            batch, length = [], 0
+        length += alert_length + (ALERT_SEPARATOR_LENGTH if batch else 0)
+        batch.append(alert)
+    if batch:
+        batches.append(batch)
+    return batches
+
+async def send_alerts(alerts, current_time):
+    """
+    Send all alerts of a cycle as few Telegram messages as possible; returns how many alerts were delivered.
+    Only delivered alerts start their token's ALERT_COOLDOWN, so a failed send can be retried by the next check.
+    """
+    alerts_sent = 0
+    # batchها به ترتیب و یکی‌یکی ارسال می‌شوند تا پیام‌ها به همان ترتیب به هر chat برسند؛
+    # ارسال به chatهای مختلف داخل هر batch همزمان است و نرخ را AIORateLimiter خود bot کنترل می‌کند
+    for batch in batch_alerts(alerts):
+        try:
+            delivered = await send_to_all_chats(ALERT_SEPARATOR.join(alert[3] for alert in batch))
+        except Exception as e:
+            log.error(f"❌ Error sending alerts for {', '.join(alert[0] for alert in batch)}: {e}")
+            continue
+        if delivered:
+            alerts_sent += len(batch)
+            for symbol, timeframe, alert_type, _ in batch:
+                last_alert_times[SYMBOL_IDX[symbol]] = current_time
+                log.info(f"📤 {alert_type} alert sent for {symbol} ({timeframe})")
+    return alerts_sent
 
 async def send_message_safe(text, parse_mode=None):
     """Safely send a message to all Telegram chats"""
     try:
         return await send_to_all_chats(text, parse_mode)
     except Exception as e:
-        print(f"❌ Error in send_message_safe: {e}")
+        log.error(f"❌ Error in send_message_safe: {e}")
         return False
 
 async def test_bot_connection():
     """Test if bot can send messages to all chats"""
     try:
-        print("🔍 Testing bot connection...")
-        print(f"📋 Bot Token: {TOKEN[:10]}...{TOKEN[-5:] if len(TOKEN) > 15 else 'INVALID'}")
-        print(f"📋 Chat IDs: {CHAT_IDS}")
+        log.info("🔍 Testing bot connection...")
+        log.info(f"📋 Bot Token: {TOKEN[:10]}...{TOKEN[-5:] if len(TOKEN) > 15 else 'INVALID'}")
+        log.info(f"📋 Chat IDs: {CHAT_IDS}")
+        
+        # getMe و آماده‌سازی connection pool تلگرام روی همین event loop، قبل از اولین ارسال
+        await bot.initialize()
+        log.info(f"🤖 Logged in as @{bot.username}")
         
         test_message = read_message_from_file(MESSAGE_FILE_PATH)
         
         if test_message:
             success = await send_message_safe(test_message)
             if success:
-                print("✅ Bot connection test successful!")
+                log.info("✅ Bot connection test successful!")
                 return True
             else:
-                print("❌ Bot connection test failed!")
+                log.error("❌ Bot connection test failed!")
                 return False
         else:
-            print("✅ Bot connection verified (no test message to send)")
+            log.info("✅ Bot connection verified (no test message to send)")
             return True
             
     except Exception as e:
-        print(f"❌ Bot connection test failed: {e}")
-        print("💡 Please check:")
-        print("   1. BOT_TOKEN is correct")
-        print("   2. CHAT_IDs are correct") 
-        print("   3. Bot has been started in all Telegram chats (/start)")
-        print("   4. Bot is not blocked in any chat")
+        log.error(f"❌ Bot connection test failed: {e}")
+        log.info("💡 Please check:")
+        log.info("   1. BOT_TOKEN is correct")
+        log.info("   2. CHAT_IDs are correct") 
+        log.info("   3. Bot has been started in all Telegram chats (/start)")
+        log.info("   4. Bot is not blocked in any chat")
         return False
 
 def should_check_timeframe(timeframe, current_time):
@@ -503,7 +778,7 @@ def should_check_timeframe(timeframe, current_time):
     if timeframe == "daily":
         return False  # Daily is handled separately
     
-    tf_data = timeframe_data[timeframe]
+    last_check = last_check_times[TF_IDX[timeframe]]
     interval = TIMEFRAMES[timeframe]
     
     # در startup اولیه، همه تایم‌فریم‌ها رو چک نکن
@@ -511,213 +786,194 @@ def should_check_timeframe(timeframe, current_time):
         return False
     
     # اگر هیچ چک قبلی نداریم، چک کن
-    if tf_data["last_check"] == 0:
+    if last_check == 0:
         return True
     
     # چک کن که آیا زمان کافی گذشته
-    return (current_time - tf_data["last_check"]) >= interval
+    return (current_time - last_check) >= interval
 
-def update_timeframe_data(timeframe, current_data, current_time):
-    """Update historical data for a specific timeframe"""
+def update_timeframe_data(timeframe, current_time):
+    """Mark a timeframe as checked"""
     if timeframe == "daily":
         return  # Daily is handled separately
     
-    tf_data = timeframe_data[timeframe]
+    last_check_times[TF_IDX[timeframe]] = current_time
+
+def record_price_history(prices, volumes, current_time, interval=CHECK_INTERVAL):
+    """
+    Write the current price and volume vectors over the oldest history row (both copies) and advance the ring.
+    interval is the poll interval the sample was taken with. Returns False without writing if the newest row is
+    less than MIN_SAMPLE_INTERVAL old.
+    """
+    global history_pos
+    if current_time - history_times[history_pos - 1 + HISTORY_SIZE] < MIN_SAMPLE_INTERVAL:
+        return False
     
-    for symbol, data in current_data.items():
-        # پرهیز از ذخیره کردن total market cap در داده های تاریخی
-        if symbol != "_total_market_cap":
-            tf_data["prices"][symbol] = data["price"]
-            tf_data["volumes"][symbol] = data["volume"]
+    for row in (history_pos, history_pos + HISTORY_SIZE):
+        history_times[row] = current_time
+        price_history[row] = prices
+        volume_history[row] = volumes
+        history_intervals[row] = interval
+    history_pos = (history_pos + 1) % HISTORY_SIZE
+    return True
+
+def history_window():
+    """Return (times, prices, volumes, intervals) views of the history, oldest row first"""
+    window = slice(history_pos, history_pos + HISTORY_SIZE)
+    return history_times[window], price_history[window], volume_history[window], history_intervals[window]
+
+def get_window_starts(timeframes, current_time):
+    """
+    Return (rows, has_window) for the given intraday timeframes: the history row of the newest sample that is
+    at least one timeframe old, found with a single searchsorted over all window start times at once.
+    """
+    target_times = current_time - INTRADAY_SECONDS[[TF_IDX[timeframe] for timeframe in timeframes]]
     
-    tf_data["last_check"] = current_time
+    # زمان‌های پنجره صعودی است (ردیف‌های خالی با 0 در ابتدا)
+    times, _, _, intervals = history_window()
+    rows = np.searchsorted(times, target_times, side="right") - 1
+    
+    # اگر نمونه خیلی قدیمی‌تر از شروع پنجره باشد (مثلا ردیف جاافتاده یا قطعی API)، مقایسه معنی ندارد.
+    # فاصله مجاز، interval poll دو ردیف دو طرف شروع پنجره است؛ فقط کند شدن poll (rate limit) آن را بیشتر می‌کند
+    row_idx = np.maximum(rows, 0)
+    next_idx = np.minimum(row_idx + 1, HISTORY_SIZE - 1)
+    max_gap = np.maximum(intervals[row_idx], intervals[next_idx]) + WINDOW_GAP_MARGIN
+    has_window = (rows >= 0) & (target_times - times[row_idx] <= max_gap)
+    return row_idx, has_window
 
-def get_price_changes(timeframe, current_data):
-    """Calculate price and volume changes for a specific timeframe"""
-    if timeframe == "daily":
-        return {}  # Daily is handled separately
+def get_price_changes(timeframes, prices, volumes, current_time):
+    """
+    Calculate price and volume changes (%) over the rolling window of each given intraday timeframe at once.
+    Returns (price_changes, volume_changes, valid) matrices with one row per timeframe;
+    rows of timeframes without a usable window are all invalid.
+    """
+    row_idx, has_window = get_window_starts(timeframes, current_time)
+    _, window_prices, window_volumes, _ = history_window()
     
-    tf_data = timeframe_data[timeframe]
-    changes = {}
+    # (T, N): ردیف k مقادیر شروع پنجره تایم‌فریم k است
+    old_prices = np.where(has_window[:, None], window_prices[row_idx], np.nan)
+    old_volumes = np.where(has_window[:, None], window_volumes[row_idx], np.nan)
+    # NaN یعنی توکن در آن چرخه داده نداشته؛ مقایسه‌های NaN خودشان False هستند ولی isfinite صریح‌تر است
+    valid = np.isfinite(old_prices) & (old_prices > 0) & (old_volumes > 0) & (prices > 0)
+    price_changes = percent_change(prices, old_prices, valid)
+    volume_changes = percent_change(volumes, old_volumes, valid)
     
-    for symbol, current_info in current_data.items():
-        # پرهیز از پردازش total market cap
-        if symbol == "_total_market_cap":
-            continue
-            
-        current_price = current_info["price"]
-        current_volume = current_info["volume"]
-        
-        old_price = tf_data["prices"].get(symbol)
-        old_volume = tf_data["volumes"].get(symbol)
-        
-        if old_price is not None and old_volume is not None and old_price > 0 and old_volume > 0:
-            try:
-                price_change = ((current_price - old_price) / old_price) * 100
-                volume_change = ((current_volume - old_volume) / old_volume) * 100
-                
-                changes[symbol] = {
-                    "price_change": price_change,
-                    "volume_change": volume_change,
-                    "current_price": current_price,
-                    "current_volume": current_volume,
-                    "market_cap": current_info.get("market_cap", 0)
-                }
-            except ZeroDivisionError:
-                print(f"⚠️ Division by zero for {symbol} in {timeframe}")
-                continue
-    
-    return changes
-
-async def check_timeframe(timeframe, current_data, current_time):
-    """Check a specific timeframe for alerts"""
+    return price_changes, volume_changes, valid
+
+def check_timeframe(timeframe, snapshot, price_change, volume_change, valid, current_time, daily_changes, alerted,
+                    total_market_cap_text="", snapshot_date="today"):
+    """
+    Check a specific timeframe for alerts and return them (built, not sent). Its change vectors are one row of
+    get_price_changes, and daily_changes is computed once per cycle by the caller.
+    alerted marks tokens that already have an alert in this cycle; it is updated with the new alerts.
+    """
     if timeframe == "daily":
-        return 0  # Daily is handled separately
+        return []  # Daily is handled separately
     
-    print(f"🔍 Checking {timeframe} timeframe...")
+    log.debug(f"🔍 Checking {timeframe} timeframe...")
     
-    # Get price changes for this timeframe
-    changes = get_price_changes(timeframe, current_data)
+    if not valid.any():
+        log.warning(f"⚠️ No historical data available for {timeframe} comparison")
+        update_timeframe_data(timeframe, current_time)
+        return []
     
-    if not changes:
-        print(f"⚠️ No historical data available for {timeframe} comparison")
-        update_timeframe_data(timeframe, current_data, current_time)
-        return 0
+    if log.isEnabledFor(logging.DEBUG):
+        for i in np.flatnonzero(valid):
+            log.debug(f"💰 {SYMBOLS[i]} ({timeframe}): Price: {price_change[i]:+.2f}%, Volume: {volume_change[i]:+.2f}%"
+                      f"{f', Daily: {daily_changes[i]:+.2f}%' if not np.isnan(daily_changes[i]) else ''}")
     
-    alerts_sent = 0
-    total_market_cap = current_data.get("_total_market_cap", 0)
-    daily_changes = get_daily_changes(current_data)
+    # چک کردن تغییرات قیمت معنادار - فقط توکن‌هایی که از threshold رد شدند
+    significant = valid & (np.abs(price_change) >= PRICE_CHANGE_THRESHOLD)
     
-    for symbol, change_data in changes.items():
-        price_change = change_data["price_change"]
-        volume_change = change_data["volume_change"]
-        current_price = change_data["current_price"]
-        current_volume = change_data["current_volume"]
-        market_cap = change_data.get("market_cap", 0)
-        
-        # دریافت daily change برای این symbol
-        daily_change = daily_changes.get(symbol, {}).get("daily_change")
-        
-        print(f"💰 {symbol} ({timeframe}): Price: {price_change:+.2f}%, Volume: {volume_change:+.2f}%"
-              f"{f', Daily: {daily_change:+.2f}%' if daily_change is not None else ''}")
+    # یک pump ادامه‌دار در چند تایم‌فریم پشت سر هم alert تکراری نمی‌دهد
+    # (cooldown از آخرین alert تحویل‌شده حساب می‌شود؛ در همین cycle هم هر توکن فقط یک alert دارد)
+    cooling_down = significant & ((current_time - last_alert_times < ALERT_COOLDOWN) | alerted)
+    if cooling_down.any():
+        log.info(f"🧊 Cooldown: skipping {timeframe} alerts for {', '.join(SYMBOLS[i] for i in np.flatnonzero(cooling_down))}")
+    
+    alert_idx = np.flatnonzero(significant & ~cooling_down)
+    alerted[alert_idx] = True
+    
+    alerts = []
+    for i in alert_idx:
+        daily_change = None if np.isnan(daily_changes[i]) else float(daily_changes[i])
+        change_24h = None if np.isnan(snapshot.changes_24h[i]) else float(snapshot.changes_24h[i])
         
-        # چک کردن تغییرات قیمت معنادار
-        if abs(price_change) >= PRICE_CHANGE_THRESHOLD:
-            try:
-                if await send_price_alert(symbol, current_price, price_change, current_volume, 
-                                        volume_change, timeframe, market_cap, total_market_cap, daily_change):
-                    alerts_sent += 1
-                    # تاخیر بین ارسال هر alert
-                    await asyncio.sleep(1)
-            except Exception as e:
-                print(f"❌ Error sending alert for {symbol}: {e}")
+        alert = build_price_alert(SYMBOLS[i], float(snapshot.prices[i]), float(price_change[i]),
+                                  float(snapshot.volumes[i]), float(volume_change[i]), timeframe,
+                                  float(snapshot.market_caps[i]), total_market_cap_text,
+                                  daily_change, change_24h, snapshot_date)
+        if alert is not None:
+            alerts.append(alert)
     
     # به‌روزرسانی داده‌های تایم‌فریم بعد از چک
-    update_timeframe_data(timeframe, current_data, current_time)
+    update_timeframe_data(timeframe, current_time)
     
-    if alerts_sent > 0:
-        print(f"🎯 Sent {alerts_sent} alerts for {timeframe} timeframe")
+    if alerts:
+        log.debug(f"🎯 {len(alerts)} alerts for {timeframe} timeframe")
     else:
-        print(f"😴 No significant changes in {timeframe} timeframe")
+        log.debug(f"😴 No significant changes in {timeframe} timeframe")
     
-    return alerts_sent
+    return alerts
 
-async def handle_daily_snapshot(current_data):
+async def handle_daily_snapshot(snapshot):
     """Handle daily snapshot logic"""
     try:
         if should_take_daily_snapshot():
-            if save_daily_snapshot(current_data):
+            if save_daily_snapshot(snapshot):
                 daily_data = timeframe_data["daily"]
                 snapshot_time = datetime.fromtimestamp(daily_data["last_snapshot"]).strftime('%H:%M:%S')
                 snapshot_date = daily_data["snapshot_date"]
                 
                 # ارسال notification مربوط به daily snapshot
-                total_market_cap = current_data.get("_total_market_cap", 0)
-                if total_market_cap >= 1e9:
-                    cap_str = f"${total_market_cap/1e9:.2f}B"
-                elif total_market_cap >= 1e6:
-                    cap_str = f"${total_market_cap/1e6:.2f}M"
-                else:
-                    cap_str = f"${total_market_cap:,.0f}"
+                cap_str = format_cap(snapshot.total_market_cap)
                 
                 snapshot_msg = (
                     f"📅 Daily Snapshot Saved!\n"
                     f"🕕 Time: {snapshot_date} at {snapshot_time}\n"
                     f"💰 Total Portfolio Cap: {cap_str}\n"
-                    f"📊 Tokens: {len([k for k in current_data.keys() if k != '_total_market_cap'])}\n"
+                    f"📊 Tokens: {snapshot.token_count}\n"
                     f"ℹ️ This will be used for 24h change calculations"
                 )
                 
                 await send_message_safe(snapshot_msg)
                 return True
     except Exception as e:
-        print(f"❌ Error in daily snapshot handling: {e}")
+        log.error(f"❌ Error in daily snapshot handling: {e}")
     
     return False
 
-async def send_regular_update(data):
-    """Send regular price update to all chats"""
+def format_update_row(snapshot, i, change):
+    """یک خط پیام Price Update برای توکن i (change: تغییر 24 ساعته یا NaN)"""
+    market_cap = snapshot.market_caps[i]
+    cap_str = f"({format_cap(market_cap)})" if market_cap > 0 else ""
+    change_str = f" [24h: {change:+.2f}%]" if not np.isnan(change) else ""
+    emoji = CHANGE_EMOJIS.get(np.sign(change), "💰")
+    return f"{emoji} **{SYMBOLS[i]}**: {format_price(snapshot.prices[i])} {cap_str}{change_str}"
+
+async def send_regular_update(snapshot, daily_changes):
+    """Send regular price update to all chats (the caller checks SEND_REGULAR_UPDATES)"""
     global last_update_time
-    current_time = time.time()
+    now = time.monotonic()
     
-    # Only send regular updates if enabled and interval has passed
-    if not SEND_REGULAR_UPDATES or (current_time - last_update_time) < UPDATE_INTERVAL:
-        return
-    
-    if not data:
+    # Only send regular updates once the interval has passed
+    if (now - last_update_time) < UPDATE_INTERVAL:
         return
     
     msg_parts = ["📊 **Price Update:**\n"]
-    total_market_cap = data.get("_total_market_cap", 0)
-    daily_changes = get_daily_changes(data)
+    total_market_cap = snapshot.total_market_cap
     
     try:
-        for symbol, info in data.items():
-            # پرهیز از نمایش total market cap در لیست توکن ها
-            if symbol == "_total_market_cap":
-                continue
-                
-            price = info["price"]
-            market_cap = info.get("market_cap", 0)
-            daily_change = daily_changes.get(symbol, {}).get("daily_change")
-            
-            # فرمت بهتر برای قیمت
-            if price < 0.0001:
-                price_str = f"${price:.10f}"
-            elif price < 0.01:
-                price_str = f"${price:.8f}"
-            else:
-                price_str = f"${price:.6f}"
-            
-            # فرمت market cap
-            if market_cap >= 1e9:
-                cap_str = f"({market_cap/1e9:.2f}B)"
-            elif market_cap >= 1e6:
-                cap_str = f"({market_cap/1e6:.2f}M)"
-            elif market_cap > 0:
-                cap_str = f"(${market_cap:,.0f})"
-            else:
-                cap_str = ""
-            
-            # فرمت daily change
-            daily_str = ""
-            if daily_change is not None:
-                if daily_change > 0:
-                    daily_str = f" [24h: +{daily_change:.2f}%]"
-                else:
-                    daily_str = f" [24h: {daily_change:.2f}%]"
-            
-            msg_parts.append(f"💰 **{symbol}**: {price_str} {cap_str}{daily_str}")
+        # تغییر 24 ساعته: نسبت به baseline ساعت 6 صبح، وگرنه تغییر rolling خود CoinGecko
+        changes = np.where(np.isnan(daily_changes), snapshot.changes_24h, daily_changes)
+        
+        # فقط توکن‌هایی که در این cycle داده داشتند؛ توکن‌هایی که تغییرشان به 0.00% گرد می‌شود حذف می‌شوند
+        shown = np.isfinite(snapshot.prices) & (np.round(changes, 2) != 0)
+        msg_parts.extend([format_update_row(snapshot, i, changes[i]) for i in np.flatnonzero(shown)])
         
         # اضافه کردن total market cap
         if total_market_cap > 0:
-            if total_market_cap >= 1e9:
-                total_cap_str = f"${total_market_cap/1e9:.2f}B"
-            elif total_market_cap >= 1e6:
-                total_cap_str = f"${total_market_cap/1e6:.2f}M"
-            else:
-                total_cap_str = f"${total_market_cap:,.0f}"
-            msg_parts.append(f"\n🏆 **Total Portfolio Cap**: {total_cap_str}")
+            msg_parts.append(f"\n🏆 **Total Portfolio Cap**: {format_cap(total_market_cap)}")
         
         # اضافه کردن daily snapshot info
         daily_data = timeframe_data["daily"]
@@ -727,119 +983,227 @@ async def send_regular_update(data):
         msg_parts.append(f"\n🕐 Updated: {time.strftime('%H:%M:%S')}")
         
         await send_to_all_chats("\n".join(msg_parts), parse_mode='Markdown')
-        last_update_time = current_time
-        print("📤 Regular update sent to all chats")
+        last_update_time = now
+        log.info("📤 Regular update sent to all chats")
     except Exception as e:
-        print(f"❌ Error sending regular update: {e}")
+        log.error(f"❌ Error sending regular update: {e}")
 
-async def check_all_timeframes():
-    """Check all tokens across multiple timeframes and handle daily snapshots"""
-    print("🔁 Fetching current token data...")
+async def check_all_timeframes(snapshot, current_time, stale=False):
+    """Check one fetched Snapshot across multiple timeframes and handle daily snapshots"""
+    alerts = []
     
-    current_data = get_all_prices_and_volumes()
+    # Handle daily snapshot first
+    await handle_daily_snapshot(snapshot)
     
-    if not current_data:
-        print("❌ No data received from API")
+    if stale:
+        # داده تکراری نباید به عنوان نمونه جدید در history ثبت شود یا alert بدهد
+        log.info("⏭️ Skipping timeframe checks for cached snapshot")
+        if SEND_REGULAR_UPDATES and not SEND_ONLY_PUMPS:
+            await send_regular_update(snapshot, get_daily_changes(snapshot.prices))
         return
     
-    current_time = time.time()
-    total_alerts = 0
+    # بخش‌های مشترک همه alertهای این cycle فقط یک بار ساخته می‌شوند
+    total_market_cap_text = format_total_cap_line(snapshot.total_market_cap)
+    snapshot_date = timeframe_data["daily"].get("snapshot_date") or "today"
+    daily_changes = get_daily_changes(snapshot.prices)
+    alerted = np.zeros(len(SYMBOLS), dtype=bool)
     
-    # Handle daily snapshot first
-    await handle_daily_snapshot(current_data)
+    # تغییرات همه تایم‌فریم‌های موعددار در یک محاسبه برداری (یک ردیف برای هر تایم‌فریم)
+    due = [tf for tf in INTRADAY_TIMEFRAMES if should_check_timeframe(tf, current_time)]
+    if due:
+        price_changes, volume_changes, valid = get_price_changes(due, snapshot.prices, snapshot.volumes, current_time)
     
     # Check each timeframe (excluding daily)
-    for timeframe in TIMEFRAMES.keys():
-        if timeframe == "daily":
-            continue  # Daily is handled separately
-        
+    for timeframe in INTRADAY_TIMEFRAMES:
         try:
-            if should_check_timeframe(timeframe, current_time):
-                alerts = await check_timeframe(timeframe, current_data, current_time)
-                total_alerts += alerts
+            if timeframe in due:
+                k = due.index(timeframe)
+                alerts.extend(check_timeframe(timeframe, snapshot, price_changes[k], volume_changes[k], valid[k],
+                                              current_time, daily_changes, alerted, total_market_cap_text,
+                                              snapshot_date))
             else:
-                remaining_time = TIMEFRAMES[timeframe] - (current_time - timeframe_data[timeframe]["last_check"])
-                print(f"⏭️ Skipping {timeframe} timeframe (next check in {remaining_time/60:.1f} min)")
+                remaining_time = TIMEFRAMES[timeframe] - (current_time - last_check_times[TF_IDX[timeframe]])
+                log.debug(f"⏭️ Skipping {timeframe} timeframe (next check in {remaining_time/60:.1f} min)")
         except Exception as e:
-            print(f"❌ Error checking {timeframe}: {e}")
+            log.error(f"❌ Error checking {timeframe}: {e}")
     
-    # Initialize empty timeframes (first run)
-    for timeframe in TIMEFRAMES.keys():
-        if timeframe == "daily":
-            continue
-        tf_data = timeframe_data[timeframe]
-        if not tf_data["prices"]:
-            update_timeframe_data(timeframe, current_data, current_time)
-            print(f"🔄 Initialized {timeframe} timeframe data")
+    # Keep this cycle as a future window start for every timeframe
+    if record_price_history(snapshot.prices, snapshot.volumes, current_time, poll_interval):
+        save_price_history_state()
+    
+    # همه alertهای همه تایم‌فریم‌ها با هم و در کمترین تعداد پیام ارسال می‌شوند
+    total_alerts = await send_alerts(alerts, current_time) if alerts else 0
     
     # Send regular updates if enabled
     if SEND_REGULAR_UPDATES and not SEND_ONLY_PUMPS:
-        await send_regular_update(current_data)
+        await send_regular_update(snapshot, daily_changes)
     
-    if total_alerts > 0:
-        print(f"🎯 Total alerts sent: {total_alerts}")
-    else:
-        print("😴 No alerts sent this cycle")
+    # یک خط خلاصه برای کل cycle (جزئیات هر تایم‌فریم در DEBUG)
+    log.info(f"📋 Cycle summary: {snapshot.token_count} tokens, checked {', '.join(due) or 'no timeframes'}, "
+             f"{len(alerts)} alerts found, {total_alerts} sent")
+
+async def queue_stale_snapshot(queue):
+    """Queue the last good Snapshot as a stale cycle if it is younger than STALE_SNAPSHOT_MAX_AGE"""
+    if last_good_snapshot is None:
+        return
+    
+    fetched_at, fetched_mono, snapshot = last_good_snapshot
+    age = time.monotonic() - fetched_mono
+    if age < STALE_SNAPSHOT_MAX_AGE:
+        log.warning(f"⚠️ Using cached snapshot (age={age:.0f}s)")
+        await queue.put((fetched_at, snapshot, True))
+
+async def fetch_loop(queue):
+    """Producer: poll CoinGecko every CHECK_INTERVAL seconds and queue (fetch time, Snapshot, stale) for processing"""
+    global last_good_snapshot
+    
+    # پول‌ها روی یک شبکه زمانی ثابت (monotonic) انجام می‌شوند تا مدت هر fetch فاصله‌ها را جابجا نکند
+    loop = asyncio.get_running_loop()
+    next_tick = loop.time()
+    
+    while True:
+        # تا زمانی که CoinGecko گفته (Retry-After) درخواست جدید نفرست
+        if time.monotonic() < rate_limited_until:
+            log.info(f"⏸️ Rate limited - skipping fetch ({rate_limited_until - time.monotonic():.0f}s left)")
+            await queue_stale_snapshot(queue)
+        else:
+            try:
+                log.info("🔁 Fetching current token data...")
+                snapshot = await get_all_prices_and_volumes()
+                if snapshot is not None:
+                    fetched_at = time.time()
+                    last_good_snapshot = (fetched_at, time.monotonic(), snapshot)
+                    await queue.put((fetched_at, snapshot, False))
+                else:
+                    log.error("❌ No data received from API")
+                    await queue_stale_snapshot(queue)
+            except Exception as e:
+                log.error(f"❌ Error fetching token data: {e}")
+        
+        next_tick += poll_interval
+        now = loop.time()
+        if next_tick < now:
+            next_tick = now  # این cycle از موعد گذشت؛ tickهای از دست رفته جبران نمی‌شوند
+        
+        delay = next_tick - now + random.uniform(0, FETCH_JITTER)
+        log.info(f"⏳ Waiting {delay:.1f} seconds for next check...")
+        await asyncio.sleep(delay)
+
+async def process_loop(queue):
+    """Consumer: run timeframe checks, snapshots and updates for each fetched cycle"""
+    cycle_count = 0
+    
+    while True:
+        current_time, snapshot, stale = await queue.get()
+        cycle_count += 1
+        log.info("=" * 60)
+        log.info(f"🕐 Check cycle #{cycle_count} at {datetime.fromtimestamp(current_time).strftime('%Y-%m-%d %H:%M:%S')}"
+                 f"{' (cached snapshot)' if stale else ''}")
+        
+        try:
+            await check_all_timeframes(snapshot, current_time, stale)
+        except Exception as e:
+            log.error(f"❌ Error in check cycle: {e}")
+            # ارسال خطا فقط برای خطاهای مهم
+            if "rate limit" in str(e).lower() or "connection" in str(e).lower():
+                await send_message_safe(f"⚠️ Bot error: {str(e)[:100]}...")
+        finally:
+            queue.task_done()
 
 async def main_async():
     """Main async bot loop"""
+    global http_client
+    
     if not await test_bot_connection():
-        print("🛑 Stopping due to connection issues")
+        log.info("🛑 Stopping due to connection issues")
+        await bot.shutdown()
         return
     
-    # Load existing daily snapshot on startup
+    # Load existing daily snapshot and recent price history on startup
     load_daily_snapshot()
+    load_price_history_state()
+    
+    http_client = httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        headers=HTTP_HEADERS,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, keepalive_expiry=HTTP_KEEPALIVE_EXPIRY)
+    )
     
     try:        
-        print("🚀 Multi-timeframe bot started successfully!")
-        print(f"📊 Monitoring timeframes: {[tf for tf in TIMEFRAMES.keys() if tf != 'daily']}")
-        print(f"📅 Daily snapshot time: {DAILY_SNAPSHOT_HOUR:02d}:{DAILY_SNAPSHOT_MINUTE:02d}")
-        print(f"⏱️ Check interval: {CHECK_INTERVAL} seconds")
-        print(f"🎯 Price change threshold: {PRICE_CHANGE_THRESHOLD}%")
-        print(f"📈 Monitoring {len(TOKENS)} tokens")
+        log.info("🚀 Multi-timeframe bot started successfully!")
+        log.info(f"📊 Monitoring timeframes: {list(INTRADAY_TIMEFRAMES)}")
+        log.info(f"📅 Daily snapshot time: {DAILY_SNAPSHOT_HOUR:02d}:{DAILY_SNAPSHOT_MINUTE:02d}")
+        log.info(f"⏱️ Check interval: {CHECK_INTERVAL} seconds")
+        log.info(f"🎯 Price change threshold: {PRICE_CHANGE_THRESHOLD}%")
+        log.info(f"📈 Monitoring {len(TOKENS)} tokens")
         
         # Show current daily snapshot status
         daily_data = timeframe_data["daily"]
         if daily_data.get("snapshot_date"):
-            print(f"📅 Daily baseline loaded: {daily_data['snapshot_date']} ({len(daily_data['prices'])} tokens)")
+            log.info(f"📅 Daily baseline loaded: {daily_data['snapshot_date']} ({len(daily_data['prices'])} tokens)")
         else:
-            print("📅 No daily baseline found - will create one at next 6AM")
-        
-        cycle_count = 0
+            log.info("📅 No daily baseline found - will create one at next 6AM")
         
-        while True:
-            cycle_count += 1
-            print(f"\n{'='*60}")
-            print(f"🕐 Check cycle #{cycle_count} at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-            
+        # SIGINT/SIGTERM فقط یک Event را set می‌کنند تا خاموش شدن از همین loop و با بستن تمیز connectionها انجام شود
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
             try:
-                await check_all_timeframes()
-            except Exception as e:
-                print(f"❌ Error in check cycle: {e}")
-                # ارسال خطا فقط برای خطاهای مهم
-                if "rate limit" in str(e).lower() or "connection" in str(e).lower():
-                    await send_message_safe(f"⚠️ Bot error: {str(e)[:100]}...")
-            
-            print(f"⏳ Waiting {CHECK_INTERVAL} seconds for next check...")
-            await asyncio.sleep(CHECK_INTERVAL)
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:
+                pass  # Windows: Ctrl+C still arrives as KeyboardInterrupt
+        
+        # Fetching and alerting run as separate tasks so Telegram sends never delay the next poll
+        queue = asyncio.Queue(maxsize=FETCH_QUEUE_SIZE)
+        tasks = [
+            asyncio.create_task(fetch_loop(queue)),
+            asyncio.create_task(process_loop(queue))
+        ]
+        stop_task = asyncio.create_task(stop_event.wait())
+        try:
+            done, _ = await asyncio.wait([*tasks, stop_task], return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()  # re-raise if a loop task died
+        finally:
+            # sleep یا درخواست در حال انجام همین‌جا cancel می‌شود، نه بعد از CHECK_INTERVAL
+            for task in tasks + [stop_task]:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+        
+        log.info("🛑 Stop signal received, shutting down")
+        stop_message = read_message_from_file(MESSAGE_FILE_PATH)
+        if stop_message:
+            await send_message_safe(stop_message)
             
     except KeyboardInterrupt:
-        print("\n🛑 Bot stopped by user")
+        log.info("🛑 Bot stopped by user")
         stop_message = read_message_from_file(MESSAGE_FILE_PATH)
         if stop_message:
             await send_message_safe(stop_message)
     except Exception as e:
-        print(f"💥 Fatal error: {e}")
+        log.error(f"💥 Fatal error: {e}")
         await send_message_safe(f"💥 Bot crashed: {str(e)[:100]}...")
+    finally:
+        await http_client.aclose()
+        await bot.shutdown()
 
 def main():
     """Main function to run the async bot"""
+    # uvloop (اگر نصب باشد) event loop سریع‌تری برای I/O شبکه است
+    # uvloop.run فقط loop همین اجرا را عوض می‌کند (uvloop.install در Python 3.12+ منسوخ شده)
+    try:
+        import uvloop
+        run = uvloop.run
+        log.info("⚡ Using uvloop event loop")
+    except ImportError:
+        run = asyncio.run
+    
     try:
-        asyncio.run(main_async())
+        run(main_async())
     except KeyboardInterrupt:
-        print("\n🛑 Bot stopped by user")
+        log.info("🛑 Bot stopped by user")
     except Exception as e:
-        print(f"💥 Fatal error in main: {e}")
+        log.error(f"💥 Fatal error in main: {e}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# main.py خودش را در import تنظیم می‌کند و بدون این دو متغیر اجرا نمی‌شود
+os.environ.setdefault("BOT_TOKEN", "123:test")
+os.environ.setdefault("CHAT_ID", "1")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture
+def empty_history(monkeypatch):
+    """Give each test its own empty price history ring"""
+    size = 2 * main.HISTORY_SIZE
+    monkeypatch.setattr(main, "history_times", np.zeros(size))
+    monkeypatch.setattr(main, "price_history", np.full((size, len(main.SYMBOLS)), np.nan))
+    monkeypatch.setattr(main, "volume_history", np.full((size, len(main.SYMBOLS)), np.nan))
+    monkeypatch.setattr(main, "history_intervals", np.full(size, float(main.CHECK_INTERVAL)))
+    monkeypatch.setattr(main, "history_pos", 0)
+    return main
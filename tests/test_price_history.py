@@ -0,0 +1,75 @@
+import random
+
+import numpy as np
+
+import main
+
+
+def fetch_times(count, slow_every=0, seed=1):
+    """
+    Sample timestamps as fetch_loop produces them: a CHECK_INTERVAL grid plus jitter, stamped after the fetch,
+    so each one also includes the fetch's round trip (and, every slow_every polls, a retried fetch).
+    """
+    rng = random.Random(seed)
+    times = []
+    for k in range(count):
+        fetch_duration = rng.uniform(0.2, 2.5)
+        if slow_every and k % slow_every == 0:
+            fetch_duration += main.FETCH_RETRY_BASE_DELAY + main.HTTP_CONNECT_TIMEOUT
+        times.append(1_000_000 + k * main.CHECK_INTERVAL + rng.uniform(0, main.FETCH_JITTER) + fetch_duration)
+    return times
+
+
+def record(times):
+    ones = np.ones(len(main.SYMBOLS))
+    return [main.record_price_history(ones, ones, t) for t in times]
+
+
+def test_every_poll_is_recorded_despite_fetch_time(empty_history):
+    assert all(record(fetch_times(1000)))
+
+
+def test_poll_after_slow_fetch_is_recorded(empty_history):
+    assert all(record(fetch_times(200, slow_every=10)))
+
+
+def test_ring_spans_longest_timeframe(empty_history):
+    times = fetch_times(100, slow_every=10)
+    record(times)
+    _, has_window = main.get_window_starts(main.INTRADAY_TIMEFRAMES, times[-1] + main.CHECK_INTERVAL)
+    assert has_window.all()
+
+
+def test_samples_closer_than_floor_are_dropped(empty_history):
+    assert record([1000.0, 1000.0 + main.MIN_SAMPLE_INTERVAL / 2, 1000.0 + main.MIN_SAMPLE_INTERVAL]) == [
+        True, False, True]
+
+
+def record_grid(count, interval, start=1_000_000.0, skip=()):
+    """Record count samples exactly interval apart, leaving out the sample numbers in skip"""
+    ones = np.ones(len(main.SYMBOLS))
+    for k in range(count):
+        if k not in skip:
+            main.record_price_history(ones, ones, start + k * interval, interval)
+    return start + (count - 1) * interval
+
+
+def test_missing_row_is_not_used_as_window_start(empty_history):
+    # بدون نمونه 18، شروع پنجره 3min به نمونه 17 می‌افتد که 181s قبل از آن است
+    last = record_grid(21, main.CHECK_INTERVAL, skip={18})
+    _, has_window = main.get_window_starts(("3min", "5min", "15min"), last + 1)
+    assert has_window.tolist() == [False, True, True]
+
+
+def test_slowed_polling_keeps_every_window(empty_history):
+    last = record_grid(10, main.RATE_LIMIT_SLOW_INTERVAL)
+    _, has_window = main.get_window_starts(main.INTRADAY_TIMEFRAMES, last + main.RATE_LIMIT_SLOW_INTERVAL)
+    assert has_window.all()
+
+
+def test_windows_survive_polling_speeding_up_again(empty_history):
+    last = record_grid(10, main.RATE_LIMIT_SLOW_INTERVAL)
+    last = record_grid(4, main.CHECK_INTERVAL, start=last + main.CHECK_INTERVAL)
+    for t in np.arange(last + 1, last + main.CHECK_INTERVAL, 10.0):
+        _, has_window = main.get_window_starts(main.INTRADAY_TIMEFRAMES, t)
+        assert has_window.all()
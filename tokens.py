@@ -1,9 +1,9 @@
 TOKENS = {
     "bitcoin": "BTC",
     "dogecoin": "DOGE",
-    "baby-doge-coin": "BABYDOGE",
+    "baby-doge-coin": "Baby-Doge",
     "terra-luna": "LUNA",
-    "shiba-inu": "SHIB",
+    "shiba-inu": "Shiba",
     "ripple": "XRP",
     "dogs-2":"DOGS",
     "x-empire":"X Empire",
@@ -13,16 +13,14 @@ TOKENS = {
     "aptos":"Aptos",
     "stupidcoin-2":"STUPID",
     "jupiter-exchange-solana":"JUPITER",
-    "shiba-inu":"Shiba",
     "solana":"Solana",
     "the-open-network":"Ton",
     "pudgy-penguins":"Pudgy Penguins",
     "polkadot":"Polkadot",
     "sonic-3":"SONIC",
     "stellar":"Stellar",
-    "polygon-ecosystem-token":"PLYGON",
+    "polygon-ecosystem-token":"Matic",
     "official-trump":"TRUMP",
-    "baby-doge-coin":"Baby-Doge",
     "pancakeswap-token":"CAKE",
     "solayer":"Layer",
     "xen-crypto":"Xen",
@@ -36,15 +34,13 @@ TOKENS = {
     "render-token":"RENDER",
     "filecoin":"FILECOIN",
     "bonk":"BONK",
-    "sonic-3":"SONIC",
     "floki":"FLOKI",
-    "notcoin":"NOT",
+    "notcoin":"Not",
     "lambo-4":"LAMBO",
     "hosico-cat":"HOSICO CAT",
     "book-of-ai-meow":"BOAM",
     "sahara-ai":"SAHARA-AI",
     "chill-guy":"CHILL GUY",
-    "official-trump":"TRUMP",
     "ethereum":"Ethereum",
     "hyperliquid":"HyperLiquid",
     "chainlink":"Chain Link",
@@ -54,9 +50,7 @@ TOKENS = {
     "gooncoin":"GOONC",
     "plume":"PLUME",
     "gatechain-token":"Gate",
-    "polygon-ecosystem-token":"Matic",
     "flock-2":"Flock",
-    "notcoin":"Not",
     "gram-2":"Gram",
     "sei-network":"SEI",
     "story-2":"IP",
@@ -68,16 +62,14 @@ TOKENS = {
     "supah":"SUPAH",
     "huma-finance":"HUMA",
     "bone-shibaswap":"Bone-Shiba",
-    "flock-2":"Flock",
     "rune-pups":"PUPS",
     "pooh":"POOH",
-    "assisterr-ai":"ASSi-AI",
+    "assisterr-ai":"ASRR",
     "agentfun-ai":"AGENTFun",
     "book-of-meme":"BOOK-OF-MEME",
     "fitcoin-3":"FITCoin",
     "zuzalu-inu":"Zuzalu",
     "kava": "Kava",
-    "assisterr-ai":"ASRR",
     "aspecta":"ASP",
     "lagrange":"LAGRANGE",
     "trusta-ai":"TRUSTA-AI",